@@ -1,13 +1,32 @@
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
 import requests
-from flask import Flask, render_template, request
+import urllib3
+import xxhash
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, Response, render_template, request, stream_with_context
 import os
 from dotenv import load_dotenv
 
-# Загружаем переменные окружения из файла .env (если он есть).
-load_dotenv()
+# Загружаем переменные окружения из файла .env (если он есть) — один раз:
+# повторный `importlib.reload(app)` не перечитывает файл. Под gunicorn используйте
+# `--preload`: тогда .env читается в master-процессе, и воркеры наследуют окружение.
+if not globals().get('_ENV_LOADED'):
+    load_dotenv(override=False, verbose=False)
+    _ENV_LOADED = True
 
 app = Flask(__name__)
 
+# Режим отладки включается только явно (FLASK_DEBUG=1). Вне него шаблон
+# компилируется один раз и переиспользуется — без stat() файла на каждый рендер.
+FLASK_DEBUG = os.getenv('FLASK_DEBUG', '0') == '1'
+app.config['TEMPLATES_AUTO_RELOAD'] = FLASK_DEBUG
+app.jinja_env.auto_reload = FLASK_DEBUG
+
 # По умолчанию используем заданный в ТЗ endpoint Mentorpiece
 MENTORPIECE_API_ENDPOINT = os.getenv(
     "MENTORPIECE_API_ENDPOINT",
@@ -19,6 +38,283 @@ MENTORPIECE_API_ENDPOINT = os.getenv(
 # `MENTORPIECE_API_KEY` задана в окружении или в файле .env.
 MENTORPIECE_API_KEY = os.getenv("MENTORPIECE_API_KEY")
 
+# API-key для OpenAI (используется `call_openai`).
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Защищённо подготовим ключ один раз при импорте: убираем случайный префикс "Bearer ", если он есть.
+_openai_api_key = (OPENAI_API_KEY or "").strip()
+if _openai_api_key.lower().startswith("bearer "):
+    _openai_api_key = _openai_api_key.split(" ", 1)[1]
+
+# Таймауты (connect, read): соединение должно устанавливаться быстро,
+# а на генерацию ответа LLM даём до 15 сек. Таймаут чтения — верхняя граница:
+# фактический подстраивается под недавнюю задержку upstream (см. `_read_timeout`).
+MENTORPIECE_TIMEOUT = (3.05, 15)
+OPENAI_TIMEOUT = (3.05, 20)
+
+# Политика повторов для запросов к LLM. Запросы платные и неидемпотентные, поэтому:
+# - ошибки установки соединения (запрос не ушёл) повторяются до двух раз;
+# - ответ 502/503/504 повторяется не более одного раза и только если он пришёл быстро
+#   (в пределах `LLM_RETRY_WINDOW` сек от начала вызова): медленный 504 означает, что
+#   upstream, вероятно, уже потратил бюджет на генерацию, а повтор получил бы новый
+#   полный таймаут чтения;
+# - таймаут чтения не повторяется — иначе медленный upstream держал бы запрос
+#   кратно дольше бюджета;
+# - заголовок `Retry-After` игнорируется: urllib3 спал бы по нему до 6 часов и
+#   повторял бы ещё и 413/429, вне таймаута и circuit breaker'а. Ответ 429/413
+#   возвращается сразу, 503 повторяется по общим правилам выше.
+# После исчерпания попыток возвращается последний ответ.
+LLM_RETRY_WINDOW = 2
+
+
+class _LLMRetry(Retry):
+    """
+    `Retry` с ограничением по времени: ответы-ошибки повторяются только до `deadline`
+    (значение `time.monotonic()`); без `deadline` действуют только счётчики попыток.
+    """
+
+    def __init__(self, *args, deadline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deadline = deadline
+
+    def new(self, **kw):
+        # urllib3 создаёт новый объект на каждую попытку — переносим дедлайн.
+        kw.setdefault('deadline', self.deadline)
+        return super().new(**kw)
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+LLM_RETRY = _LLMRetry(
+    total=2,
+    read=False,
+    status=1,
+    backoff_factor=0.2,
+    status_forcelist=[502, 503, 504],
+    # По умолчанию urllib3 не повторяет POST — разрешаем явно.
+    allowed_methods=frozenset(["POST"]),
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+
+# Пул keep-alive соединений для Mentorpiece (горячий путь `call_llm`).
+# urllib3 используется напрямую: тело запроса — готовые байты, заголовки статичны,
+# поэтому слой `requests` (PreparedRequest, hooks, cookie jar) здесь не нужен.
+# Соединение переиспользуется между вызовами (перевод + оценка и последующие
+# запросы пользователей), поэтому DNS, TCP-handshake и TLS оплачиваются один раз.
+#
+# Протокол — HTTP/1.1 keep-alive: перевод и оценка выполняются строго
+# последовательно (оценке нужен готовый перевод), поэтому мультиплексирование
+# HTTP/2 здесь ничего не даёт, а тёплое соединение уже переиспользуется.
+_http = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=20,
+    retries=LLM_RETRY,
+    headers={"Content-Type": "application/json"},
+)
+
+
+def _make_session():
+    """
+    Создаёт `requests.Session` с пулом keep-alive соединений и политикой `LLM_RETRY`.
+
+    Используется для менее нагруженного пути `call_openai`. `requests` не позволяет
+    задать политику повторов на отдельный вызов, поэтому здесь дедлайна нет:
+    5xx повторяется не более одного раза (`status=1`).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=LLM_RETRY)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+_openai_session = _make_session()
+# Заголовок авторизации OpenAI статичен — задаём его на сессии один раз.
+if _openai_api_key:
+    _openai_session.headers.update({"Authorization": f"Bearer {_openai_api_key}"})
+
+# In-process LRU-кеш ответов LLM: ключ — xxh3_64 от JSON с model_name и prompt,
+# нормализованным без хвостовых пробелов в строках (обычно это те же байты, что и
+# тело запроса), значение — (время записи, эти байты, строка ответа). 64-битный
+# некриптографический хеш намного быстрее sha256 на длинных prompt; возможные
+# коллизии отсекаются сравнением сохранённых байтов при попадании. Кешируются только успешные ответы,
+# поэтому повторная отправка той же формы (в т.ч. с лишним пробелом или переносом
+# строки) не делает сетевых вызовов.
+# QA: кеш отключается переменной окружения `LLM_CACHE=0`; для изоляции тестов
+# его можно очистить через `_llm_cache.clear()`.
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE', '1') == '1'
+LLM_CACHE_MAXSIZE = 1024
+LLM_CACHE_TTL = 3600
+LLM_CACHE_MAX_PROMPT_LEN = 8000
+
+_llm_cache = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+
+def _normalize_prompt(prompt):
+    """
+    Убирает хвостовые пробелы в каждой строке и пустые края prompt (для ключа кеша).
+
+    Строки делятся только по "\n": `str.splitlines()` резал бы и по `\r`, `\x0c`,
+    `\u2028` и т.п., склеивая разные тексты в один ключ.
+    """
+    return "\n".join(line.rstrip() for line in prompt.split("\n")).strip()
+
+
+def _cache_get(key, ident):
+    """
+    Возвращает закешированный ответ или None (если записи нет, она устарела
+    или под тем же ключом хранится другой `ident` — коллизия хеша).
+    """
+    with _llm_cache_lock:
+        entry = _llm_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, stored_ident, value = entry
+        if stored_ident != ident:
+            return None
+        if time.monotonic() - stored_at > LLM_CACHE_TTL:
+            del _llm_cache[key]
+            return None
+        _llm_cache.move_to_end(key)
+        return value
+
+
+def _cache_put(key, ident, value):
+    """Сохраняет ответ в кеш, вытесняя самые старые записи сверх `LLM_CACHE_MAXSIZE`."""
+    with _llm_cache_lock:
+        _llm_cache[key] = (time.monotonic(), ident, value)
+        _llm_cache.move_to_end(key)
+        while len(_llm_cache) > LLM_CACHE_MAXSIZE:
+            _llm_cache.popitem(last=False)
+
+
+# Circuit breaker для upstream-ов: после `CIRCUIT_FAILURE_THRESHOLD` подряд идущих
+# сбоев (таймаут / ошибка соединения / 5xx) вызовы сразу возвращают ошибку в течение
+# `CIRCUIT_COOLDOWN` сек, не дожидаясь таймаута. После паузы пропускается один
+# пробный запрос: успех закрывает цепь, неудача снова открывает её.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30
+
+_circuit_state = {
+    'mentorpiece': {'fail_count': 0, 'opened_at': 0.0},
+    'openai': {'fail_count': 0, 'opened_at': 0.0},
+}
+_circuit_lock = threading.Lock()
+
+
+def _circuit_allow(name):
+    """Возвращает True, если запрос к upstream `name` можно отправлять."""
+    with _circuit_lock:
+        state = _circuit_state[name]
+        if not state['opened_at']:
+            return True
+        now = time.monotonic()
+        if now - state['opened_at'] < CIRCUIT_COOLDOWN:
+            return False
+        # Half-open: пропускаем этот запрос как пробный, остальные ждут его результата.
+        state['opened_at'] = now
+        return True
+
+
+def _circuit_record_failure(name):
+    """Учитывает сбой upstream и открывает цепь при достижении порога."""
+    with _circuit_lock:
+        state = _circuit_state[name]
+        state['fail_count'] += 1
+        if state['fail_count'] >= CIRCUIT_FAILURE_THRESHOLD:
+            state['opened_at'] = time.monotonic()
+
+
+def _circuit_record_success(name):
+    """Сбрасывает счётчик сбоев и закрывает цепь после успешного ответа."""
+    with _circuit_lock:
+        state = _circuit_state[name]
+        state['fail_count'] = 0
+        state['opened_at'] = 0.0
+
+
+# Максимальная длина prompt (предотвращает отправку сверхдлинных запросов)
+MAX_PROMPT_LEN = 10000
+
+# Сколько байт тела ответа с HTTP-ошибкой показывать в сообщении
+ERROR_BODY_LIMIT = 512
+
+
+# Адаптивный таймаут чтения: для каждого upstream храним EWMA задержки ответов и
+# ждём не дольше 3 × EWMA (но не меньше `ADAPTIVE_TIMEOUT_MIN` и не больше исходного
+# таймаута). Если upstream обычно отвечает за 2 сек, зависший запрос обрывается
+# примерно через 8 сек, а не через 15. Таймаут чтения учитывается в EWMA как задержка,
+# равная использованному таймауту (фактическая была не меньше): иначе после серии
+# быстрых ответов таймаут мог бы только уменьшаться, и ставший медленным, но
+# здоровым upstream обрывался бы на каждом запросе. Таймауты учитывает и circuit breaker.
+LATENCY_EWMA_ALPHA = 0.2
+ADAPTIVE_TIMEOUT_MIN = 8
+
+_latency_ewma = {'mentorpiece': 5.0, 'openai': 8.0}
+_latency_lock = threading.Lock()
+
+
+def _read_timeout(name, max_read):
+    """Возвращает таймаут чтения для upstream `name` с учётом недавней задержки."""
+    with _latency_lock:
+        ewma = _latency_ewma[name]
+    return min(max_read, max(ADAPTIVE_TIMEOUT_MIN, 3 * ewma))
+
+
+def _record_latency(name, elapsed):
+    """Обновляет EWMA задержки upstream после ответа или таймаута чтения."""
+    with _latency_lock:
+        _latency_ewma[name] = (1 - LATENCY_EWMA_ALPHA) * _latency_ewma[name] + LATENCY_EWMA_ALPHA * elapsed
+
+
+def _build_prompt(messages):
+    """
+    Валидирует `messages` и собирает из них prompt за один проход.
+
+    Возвращает кортеж `(prompt, error)`: при успехе `error` равен None,
+    иначе `prompt` равен None, а `error` — читаемое сообщение об ошибке.
+    `None`-элементы пропускаются, каждая строка обрезается по краям один раз;
+    при превышении `MAX_PROMPT_LEN` сборка прерывается, не склеивая остаток.
+    """
+    # Готовая строка — самый частый случай: обрезаем один раз, без цикла по частям.
+    if isinstance(messages, str):
+        prompt = messages.strip()
+        if not prompt:
+            return None, "Ошибка: пустой prompt"
+        if len(prompt) > MAX_PROMPT_LEN:
+            return None, "Ошибка: слишком длинный текст"
+        return prompt, None
+
+    # Валидация входных данных: ожидаем строку или список/кортеж строк
+    if not isinstance(messages, (list, tuple)):
+        return None, "Ошибка: некорректный тип параметра messages"
+
+    parts = []
+    total_len = 0
+    content_len = 0
+    for m in messages:
+        if m is None:
+            continue
+        part = m.strip()
+        # Учитываем разделитель "\n" между частями
+        total_len += len(part) + (1 if parts else 0)
+        if total_len > MAX_PROMPT_LEN:
+            return None, "Ошибка: слишком длинный текст"
+        content_len += len(part)
+        parts.append(part)
+
+    # Части уже обрезаны, поэтому пустой prompt — это отсутствие непустых частей
+    if not content_len:
+        return None, "Ошибка: пустой prompt"
+
+    return "\n".join(parts), None
+
 
 def call_llm(model_name, messages):
     """
@@ -33,134 +329,129 @@ def call_llm(model_name, messages):
 
     Поведение и обработка ошибок подробно прокомментированы для QA:
     - Собираем `prompt` из списка сообщений (разделитель — перенос строки).
-    - Делаем `requests.post` с JSON-форматом согласно контракту: {"model_name":..., "prompt":...}
-    - Таймаут установлен на 15 сек — чтобы тестировщик видел поведение при таймаутах.
+    - Prompt сериализуется в тело запроса один раз и отправляется как есть.
+    - Успешные ответы кешируются по (model_name, prompt без хвостовых пробелов) — повторный вызов не идёт в сеть.
+    - Если upstream подряд падает (circuit breaker открыт), сразу возвращаем ошибку без запроса.
+    - Делаем POST через общий пул `_http` (keep-alive) с JSON-форматом согласно контракту: {"model_name":..., "prompt":...}
+    - Таймаут чтения — до 15 сек, подстраивается под недавнюю задержку upstream (3 × EWMA, не меньше 8 сек).
     - При HTTP-ошибке (4xx/5xx) возвращаем текст с кодом ошибки и телом ответа (если есть).
     - При сетевой ошибке возвращаем краткую диагностическую строку с исключением.
     - При некорректном JSON возвращаем понятную ошибку для QA (полезно при интеграционных тестах).
     """
 
-    # Валидация входных данных: ожидаем строку или список/кортеж строк
-    if not isinstance(messages, (str, list, tuple)):
-        return "Ошибка: некорректный тип параметра messages"
-
-    # Нормализуем вход: если передали строку, преобразуем в список с одним элементом
-    if isinstance(messages, str):
-        messages = [messages]
-
-    # Собираем текстовый prompt
-    prompt = "\n".join(m.strip() for m in messages if m is not None)
-
-    # Проверка на пустой prompt
-    if not prompt or not prompt.strip():
-        return "Ошибка: пустой prompt"
-
-    # Ограничение размера prompt (предотвращает отправку сверхдлинных запросов)
-    if len(prompt) > 10000:
-        return "Ошибка: слишком длинный текст"
-
-    payload = {"model_name": model_name, "prompt": prompt}
-
-    # Подготовка заголовков: только `Content-Type` — авторизация по ключу не нужна.
-    headers = {"Content-Type": "application/json"}
+    prompt, error = _build_prompt(messages)
+    if error:
+        return error
+
+    # Тело запроса сериализуется orjson сразу в UTF-8 байты один раз; prompt
+    # уходит в upstream без изменений.
+    body = orjson.dumps({"model_name": model_name, "prompt": prompt})
+
+    # Проверяем кеш: запрос, совпадающий с точностью до хвостовых пробелов в строках,
+    # возвращаем без сетевого вызова. Нормализация нужна только для ключа, поэтому
+    # без кеша (LLM_CACHE=0) и для слишком длинных prompt она не выполняется.
+    # Слишком длинные prompt не кешируем, чтобы ограничить расход памяти.
+    cache_key = None
+    if LLM_CACHE_ENABLED and len(prompt) <= LLM_CACHE_MAX_PROMPT_LEN:
+        normalized = _normalize_prompt(prompt)
+        # Обычно нормализация ничего не меняет — тогда ключом служат те же байты тела.
+        if normalized == prompt:
+            cache_ident = body
+        else:
+            cache_ident = orjson.dumps({"model_name": model_name, "prompt": normalized})
+        cache_key = xxhash.xxh3_64_intdigest(cache_ident)
+        cached = _cache_get(cache_key, cache_ident)
+        if cached is not None:
+            return cached
+
+    # Upstream недавно падал — не ждём таймаута, сразу отдаём ошибку.
+    if not _circuit_allow('mentorpiece'):
+        return "Ошибка: LLM временно недоступен (circuit open)"
+
+    connect_timeout, max_read = MENTORPIECE_TIMEOUT
+    read_timeout = _read_timeout('mentorpiece', max_read)
 
     try:
-        # Выполняем POST-запрос к Mentorpiece
-        resp = requests.post(MENTORPIECE_API_ENDPOINT, json=payload, headers=headers, timeout=15)
+        # Выполняем POST-запрос к Mentorpiece через общий пул соединений.
+        # Заголовок `Content-Type` уже задан на пуле — авторизация по ключу не нужна.
+        started = time.monotonic()
+        resp = _http.request(
+            'POST',
+            MENTORPIECE_API_ENDPOINT,
+            body=body,
+            timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+            retries=LLM_RETRY.new(deadline=started + LLM_RETRY_WINDOW),
+            preload_content=False,
+        )
+        try:
+            status = resp.status
+            if status >= 400:
+                # Читаем только начало тела: для диагностики его достаточно, а
+                # HTML-страница ошибки на мегабайты не будет целиком декодироваться
+                # в str. Остаток вычитываем без сохранения, чтобы вернуть соединение в пул.
+                content = resp.read(ERROR_BODY_LIMIT)
+                resp.drain_conn()
+            else:
+                content = resp.read()
+        finally:
+            resp.release_conn()
+
+        # 5xx считаем сбоем upstream; любой другой ответ означает, что сервис жив.
+        if status >= 500:
+            _circuit_record_failure('mentorpiece')
+        else:
+            _circuit_record_success('mentorpiece')
+            if status < 400:
+                _record_latency('mentorpiece', time.monotonic() - started)
 
         # Если сервер вернул код, отличный от 2xx, собираем диагностическое сообщение.
-        if resp.status_code >= 400:
+        if status >= 400:
             # Обработка 401 — подсказка про ошибку с ключом
-            if resp.status_code == 401:
+            if status == 401:
                 return "Ошибка: Unauthorized (401) от Mentorpiece. Проверьте значение MENTORPIECE_API_KEY."
-            # Пытаемся получить текст ответа (если сервер вернул JSON или текст)
-            try:
-                body = resp.text
-            except Exception:
-                body = "<не удалось прочитать тело ответа>"
-            return f"Ошибка HTTP {resp.status_code} от LLM: {body}"
+            error_body = content.decode("utf-8", errors="replace")
+            return f"Ошибка HTTP {status} от LLM: {error_body}"
 
         # Попробуем распарсить JSON и извлечь поле `response`.
+        # orjson разбирает сырые байты тела напрямую — без определения кодировки
+        # и промежуточного декодирования в str.
         try:
-            data = resp.json()
-        except ValueError:
+            data = orjson.loads(content)
+        except orjson.JSONDecodeError:
             return "Ошибка: получен некорректный JSON от LLM"
 
         # Ожидаемый формат: {"response": "..."}
         if isinstance(data, dict) and "response" in data:
             # Гарантируем, что возвращаем строку
             val = data.get("response")
-            return val if isinstance(val, str) else str(val)
+            result = val if isinstance(val, str) else str(val)
+            if cache_key is not None:
+                _cache_put(cache_key, cache_ident, result)
+            return result
 
         # Если ключа нет — вернём диагностическое сообщение с сырьём ответа
         return f"Ошибка: в ответе отсутствует поле 'response' — получено: {data}"
 
-    except requests.exceptions.Timeout:
-        return "Ошибка: таймаут при обращении к LLM (timeout=15s)"
-    except requests.exceptions.ConnectionError as e:
+    except urllib3.exceptions.MaxRetryError as e:
+        # Соединение не удалось установить и после повторов (DNS, отказ, таймаут connect).
+        _circuit_record_failure('mentorpiece')
+        if isinstance(e.reason, urllib3.exceptions.ConnectTimeoutError) and \
+                not isinstance(e.reason, urllib3.exceptions.NewConnectionError):
+            return f"Ошибка: таймаут при обращении к LLM (timeout={connect_timeout:g}s)"
+        return f"Ошибка соединения с LLM: {e.reason}"
+    except urllib3.exceptions.TimeoutError:
+        _circuit_record_failure('mentorpiece')
+        _record_latency('mentorpiece', read_timeout)
+        return f"Ошибка: таймаут при обращении к LLM (timeout={read_timeout:g}s)"
+    except urllib3.exceptions.ProtocolError as e:
+        # Соединение оборвалось во время обмена данными
+        _circuit_record_failure('mentorpiece')
         return f"Ошибка соединения с LLM: {e}"
-    except requests.exceptions.RequestException as e:
-        # Ловим любые другие исключения requests
+    except urllib3.exceptions.HTTPError as e:
+        # Ловим любые другие исключения urllib3
         return f"Ошибка запроса к LLM: {e}"
 
 
-@app.route('/', methods=['GET'])
-def index_get():
-    """
-    Рендерит форму для ввода текста и выбора языка.
-
-    QA-инструкция:
-    - Открыть страницу и проверить, что поля пустые по-умолчанию.
-    - Убедиться, что селектор языка содержит: English, French, German.
-    """
-    return render_template('index.html', original="", translation="", evaluation="", language="English")
-
-
-@app.route('/', methods=['POST'])
-def index_post():
-    """
-    Обрабатывает форму:
-    1) Получает исходный текст и выбранный язык
-    2) Вызывает LLM для перевода (модель Qwen...)
-    3) Вызывает LLM для оценки перевода (модель Claude...)
-    4) Рендерит шаблон с оригиналом, переводом и оценкой
-
-    Комментарии для QA:
-    - При пустом тексте возвращаем понятное сообщение об ошибке.
-    - При ошибке от LLM (таймаут/HTTP-ошибка/некорректный JSON) сообщение об ошибке отображается в поле перевода или оценки.
-    - Можно эмулировать ошибки, запуская прокси, который возвращает 500, или отдавая не-JSON.
-    """
-
-    original_text = request.form.get('text', '').strip()
-    language = request.form.get('language', 'English')
-
-    if not original_text:
-        # В интерфейсе отобразим подсказку в поле `evaluation`
-        evaluation = 'Пожалуйста, введите текст для перевода.'
-        return render_template('index.html', original=original_text, translation='', evaluation=evaluation, language=language)
-
-    # --- Шаг 1: перевод ---
-    translate_model = "Qwen/Qwen3-VL-30B-A3B-Instruct"
-    translate_prompt = [f"Переведи следующий текст на {language}:", original_text]
-    translation = call_llm(translate_model, translate_prompt)
-
-    # --- Шаг 2: оценка качества перевода ---
-    judge_model = "claude-sonnet-4-5-20250929"
-    judge_prompt = ["Оцени качество перевода от 1 до 10 и аргументируй.", "Оригинал:", original_text, "Перевод:", translation]
-    evaluation = call_llm(judge_model, judge_prompt)
-
-    # Рендерим шаблон, показываем оригинал, перевод и оценку
-    return render_template('index.html', original=original_text, translation=translation, evaluation=evaluation, language=language)
-
-
-if __name__ == '__main__':
-    # Запуск dev-сервера. Для продакшна используйте gunicorn/uwsgi.
-    port = int(os.getenv('PORT', '5000'))
-    app.run(host='0.0.0.0', port=port, debug=True)
-# Файл был очищён — удалён по просьбе пользо
-
-
-
 def call_openai(model_name, messages):
     """
     Простая интеграция с OpenAI Chat Completions API через HTTP.
@@ -179,21 +470,26 @@ def call_openai(model_name, messages):
         ],
         "max_tokens": 1024,
     }
-    # Защищённо подготовим ключ: убираем случайный префикс "Bearer " если он есть.
-    api_key = (OPENAI_API_KEY or "").strip()
-    if api_key.lower().startswith("bearer "):
-        api_key = api_key.split(" ", 1)[1]
-
-    if not api_key:
+    # Ключ нормализован при импорте и уже задан в заголовках `_openai_session`.
+    if not _openai_api_key:
         return "Ошибка: OPENAI_API_KEY не задан. Установите переменную окружения OPENAI_API_KEY."
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+    if not _circuit_allow('openai'):
+        return "Ошибка: OpenAI временно недоступен (circuit open)"
+
+    connect_timeout, max_read = OPENAI_TIMEOUT
+    read_timeout = _read_timeout('openai', max_read)
 
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=20)
+        started = time.monotonic()
+        resp = _openai_session.post(url, data=orjson.dumps(payload), timeout=(connect_timeout, read_timeout))
+
+        if resp.status_code >= 500:
+            _circuit_record_failure('openai')
+        else:
+            _circuit_record_success('openai')
+            if resp.status_code < 400:
+                _record_latency('openai', time.monotonic() - started)
 
         # Обрабатываем явный 401 — даём понятную подсказку для QA/developer
         if resp.status_code == 401:
@@ -202,7 +498,7 @@ def call_openai(model_name, messages):
 
         resp.raise_for_status()
 
-        data = resp.json()
+        data = orjson.loads(resp.content)
         # Структура ответа: choices[0].message.content
         choices = data.get("choices") or []
         if choices and isinstance(choices, list):
@@ -210,9 +506,16 @@ def call_openai(model_name, messages):
             return msg.get("content", "")
         # fallback: try top-level text
         return data.get("text", "")
+    except requests.exceptions.ReadTimeout as e:
+        _circuit_record_failure('openai')
+        _record_latency('openai', read_timeout)
+        return f"Ошибка запроса к OpenAI: {e}"
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        _circuit_record_failure('openai')
+        return f"Ошибка запроса к OpenAI: {e}"
     except requests.exceptions.RequestException as e:
         return f"Ошибка запроса к OpenAI: {e}"
-    except ValueError:
+    except orjson.JSONDecodeError:
         return "Ошибка: получен неверный формат ответа от OpenAI (не JSON)"
 
 
@@ -233,14 +536,20 @@ def index_post():
     Обрабатывает отправку формы:
     1) Получаем исходный текст и целевой язык.
     2) Вызываем LLM для перевода (модель Qwen...).
-    3) Вызываем LLM для оценки качества перевода (модель Claude Sonnet).
-    4) Рендерим результаты в шаблоне.
+    3) Отдаём потоком первую часть страницы (форма, оригинал, перевод).
+    4) Вызываем LLM для оценки качества перевода (модель Claude Sonnet)
+       и дописываем в поток вторую часть страницы с оценкой.
+
+    Браузер отображает перевод, пока идёт запрос к судье: время до первого
+    байта — только перевод, а не перевод + оценка.
 
     Комментарий для QA: при тестировании проверяйте поведение при пустом тексте,
     при недоступном API и при ошибочном / медленном ответе внешнего сервиса.
     """
 
-    # Получаем данные из формы
+    # Получаем данные из формы и обрезаем пробелы/переводы строк (textarea шлёт CRLF):
+    # текст попадает в оба prompt'а как есть. Если обрезать нечего, CPython
+    # возвращает ту же строку без копирования.
     original_text = request.form.get('text', '').strip()
     language = request.form.get('language', 'English')
     # Без текста нет смысла вызывать LLM — вернем понятную ошибку в интерфейс
@@ -253,34 +562,44 @@ def index_post():
     translate_model = "Qwen/Qwen3-VL-30B-A3B-Instruct"
 
     # Формируем промпт: просим модель перевести на выбранный язык.
-    translate_messages = [
-        f"Переведи следующий текст на {language}:",
-        original_text
-    ]
+    # Промпт собирается сразу одной строкой — `call_llm` не склеивает части.
+    translate_prompt = f"Переведи следующий текст на {language}:\n{original_text}"
+
+    translation = call_llm(translate_model, translate_prompt)
 
-    # Единый поведенческий путь: используем OpenAI если есть ключ, иначе mock
-    translation = call_llm(translate_model, translate_messages)
+    # Все ошибки `call_llm` начинаются с "Ошибка": оценивать текст ошибки бессмысленно,
+    # поэтому не тратим на судью ещё один запрос (и до 15 сек ожидания).
+    if translation.startswith("Ошибка"):
+        evaluation = "Перевод не выполнен — оценка пропущена."
+        return render_template('index.html', original=original_text, translation=translation, evaluation=evaluation, language=language)
 
     # --- Шаг 2: оценка качества перевода ---
+    # Оценку намеренно выполняет другая модель отдельным запросом: объединение
+    # перевода и оценки в один multi-turn вызов заставило бы модель оценивать
+    # собственный перевод, и LLM-as-a-Judge потерял бы смысл. Повторные пары
+    # запросов и так обслуживаются кешем `call_llm` без обращения к сети.
     judge_model = "claude-sonnet-4-5-20250929"
 
     # Промпт для судьи: просим оценить по шкале 1-10 и аргументировать.
-    judge_messages = [
-        "Оцени качество перевода от 1 до 10 и аргументируй.",
-        "Оригинал:",
-        original_text,
-        "Перевод:",
-        translation
-    ]
+    judge_prompt = f"""Оцени качество перевода от 1 до 10 и аргументируй.
+Оригинал:
+{original_text}
+Перевод:
+{translation}"""
 
-    evaluation = call_llm(judge_model, judge_messages)
+    def generate():
+        # Сначала отдаём форму, оригинал и перевод — не дожидаясь судьи.
+        yield render_template('index_head.html', original=original_text, translation=translation, language=language)
+        evaluation = call_llm(judge_model, judge_prompt)
+        yield render_template('index_tail.html', evaluation=evaluation)
 
-    # Рендерим шаблон с результатами — шаблон покажет оригинал, перевод и оценку
-    return render_template('index.html', original=original_text, translation=translation, evaluation=evaluation, language=language)
+    # `stream_with_context` сохраняет контекст запроса на время работы генератора.
+    return Response(stream_with_context(generate()), mimetype='text/html')
 
 
 if __name__ == '__main__':
     # Запуск dev-сервера Flask. Порт можно переопределить через переменную окружения PORT.
-    # В проде используйте WSGI-сервер (gunicorn/uvicorn).
+    # Режим отладки (reloader, интерактивный debugger) включается только явно: FLASK_DEBUG=1.
+    # В проде используйте WSGI-сервер (gunicorn, см. wsgi.py).
     port = int(os.getenv('PORT', '5000'))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    app.run(host='0.0.0.0', port=port, debug=FLASK_DEBUG)
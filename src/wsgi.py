@@ -0,0 +1,18 @@
+"""
+WSGI-точка входа для запуска приложения под gunicorn с gevent-воркерами.
+
+`monkey.patch_all()` обязан выполниться ДО импорта `app` (и, соответственно,
+`requests`/urllib3): после патча блокирующие сокетные операции переключают
+greenlet'ы, и ожидание ответа LLM (до 15 сек) больше не занимает воркер целиком —
+сотни запросов к LLM обслуживаются одним OS-потоком.
+
+Запуск (из корня репозитория):
+    gunicorn --preload --chdir src -k gevent -w 4 --worker-connections 500 wsgi:app
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+from app import app  # noqa: E402
+
+__all__ = ['app']
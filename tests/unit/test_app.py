@@ -10,26 +10,44 @@ Run with:
 Notes for QA engineers:
 - We insert `src/` into `sys.path` so we can import the application module
   as a plain `import app` which mirrors running the Flask app from `src/`.
-- We patch `app.requests.post` (the `requests` used by the app module)
-  so the tests intercept outgoing HTTP calls and return controlled values.
+- We patch `app._http.request` (the shared urllib3 connection pool used by
+  the app module) so the tests intercept outgoing HTTP calls and return
+  controlled values.
 """
 import sys
 import os
 import importlib
+import json as json_module
+import time
 from unittest.mock import patch
-import requests
+import urllib3
 
 
 class MockResponse:
-    """Простой mock-объект, имитирующий `requests.Response` с json()."""
-    def __init__(self, status_code=200, json_data=None, text_data=None):
-        self.status_code = status_code
+    """Простой mock-объект, имитирующий `urllib3.HTTPResponse` (и `requests.Response`)."""
+    def __init__(self, status_code=200, json_data=None, text_data=None, content_data=None):
+        self.status_code = self.status = status_code
         self._json = json_data or {}
         self.text = text_data or str(self._json)
+        self.content = content_data if content_data is not None else json_module.dumps(self._json).encode('utf-8')
 
     def json(self):
         return self._json
 
+    def read(self, amt=None):
+        return self.content if amt is None else self.content[:amt]
+
+    def drain_conn(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+def read_timeout_error():
+    """Исключение, которое urllib3 выбрасывает при истечении таймаута чтения."""
+    return urllib3.exceptions.ReadTimeoutError(None, None, 'Read timed out.')
+
 
 def import_app_module():
     """Импортируем модуль `app` из папки `src` и возвращаем его объект.
@@ -50,21 +68,21 @@ def import_app_module():
 def test_call_llm_success_for_translate_and_judge():
     """Positive Test: ensure call_llm возвращает ожидаемые строки при 200 OK.
 
-    Мы замокаем `requests.post` так, чтобы возвращать разные ответы в
+    Мы замокаем `app._http.request` так, чтобы возвращать разные ответы в
     зависимости от `model_name`, переданного в JSON-пейлоаде.
     """
     app = import_app_module()
 
-    def fake_post(url, json, headers=None, timeout=None):
-        model = (json or {}).get('model_name')
+    def fake_request(method, url, body=None, timeout=None, retries=None, preload_content=True):
+        model = json_module.loads(body).get('model_name')
         if model == "Qwen/Qwen3-VL-30B-A3B-Instruct":
             return MockResponse(200, {"response": "Mocked Translation: The sun is shining."})
         if model == "claude-sonnet-4-5-20250929":
             return MockResponse(200, {"response": "Mocked Grade: 9/10. Fluent and accurate."})
         return MockResponse(500, {"error": "unknown model"})
 
-    with patch.object(app, 'requests') as requests_module:
-        requests_module.post.side_effect = fake_post
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = fake_request
 
         translate = app.call_llm("Qwen/Qwen3-VL-30B-A3B-Instruct", ["Переведи", "Солнце светит."])
         assert "Mocked Translation: The sun is shining." in translate
@@ -92,21 +110,22 @@ def test_environment_loading(monkeypatch):
 
 
 def test_call_llm_handles_exceptions_gracefully():
-    """Error Handling: когда requests.post выбрасывает исключение, функция должна вернуть строку ошибки.
+    """Error Handling: когда запрос к LLM выбрасывает исключение, функция должна вернуть строку ошибки.
 
     Здесь проверяем поведение при ConnectionError и Timeout.
     """
     app = import_app_module()
 
-    with patch.object(app, 'requests') as requests_module:
+    with patch.object(app._http, 'request') as request_mock:
         # Симулируем ConnectionError
-        requests_module.post.side_effect = requests.exceptions.ConnectionError("conn failed")
+        request_mock.side_effect = urllib3.exceptions.MaxRetryError(
+            None, '/', urllib3.exceptions.NewConnectionError(None, "conn failed"))
         res = app.call_llm('any-model', ['hi'])
         assert isinstance(res, str)
         assert 'Ошибка соединения' in res or 'Ошибка запроса' in res
 
         # Симулируем Timeout
-        requests_module.post.side_effect = requests.exceptions.Timeout()
+        request_mock.side_effect = read_timeout_error()
         res2 = app.call_llm('any-model', ['hi'])
         assert isinstance(res2, str)
         assert 'таймаут' in res2 or 'тайм' in res2
@@ -116,9 +135,9 @@ def test_call_llm_timeout_slow_response():
     """Timeout / Slow Response Test: симулируем таймаут запроса и проверяем fallback."""
     app = import_app_module()
 
-    with patch.object(app, 'requests') as requests_module:
+    with patch.object(app._http, 'request') as request_mock:
         # Симулируем явный Timeout
-        requests_module.post.side_effect = requests.exceptions.Timeout()
+        request_mock.side_effect = read_timeout_error()
         res = app.call_llm('some-model', ['hello'])
         assert isinstance(res, str)
         assert 'таймаут' in res or 'Timeout' in res or 'timeout' in res
@@ -149,11 +168,406 @@ def test_call_llm_malformed_api_response():
     """Malformed API Response Test: API возвращает структуру без поля 'response'."""
     app = import_app_module()
 
-    def fake_post(url, json, headers=None, timeout=None):
+    def fake_request(method, url, body=None, timeout=None, retries=None, preload_content=True):
         return MockResponse(200, {"unexpected": "value"})
 
-    with patch.object(app, 'requests') as requests_module:
-        requests_module.post.side_effect = fake_post
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = fake_request
         res = app.call_llm('m', ['hi'])
         assert isinstance(res, str)
         assert "в ответе отсутствует поле 'response'" in res or 'response' in res
+
+
+def test_call_llm_caches_successful_responses():
+    """Cache Test: повторный вызов с тем же (model_name, prompt) не делает HTTP-запрос."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, {"response": "Cached answer"})
+        first = app.call_llm('m', ['Переведи', 'Солнце светит.'])
+        second = app.call_llm('m', ['Переведи', 'Солнце светит.'])
+        assert first == second == "Cached answer"
+        assert request_mock.call_count == 1
+
+        # Другая модель — другой ключ кеша
+        app.call_llm('other-model', ['Переведи', 'Солнце светит.'])
+        assert request_mock.call_count == 2
+
+        # После очистки кеша запрос снова уходит в сеть
+        app._llm_cache.clear()
+        app.call_llm('m', ['Переведи', 'Солнце светит.'])
+        assert request_mock.call_count == 3
+
+
+def test_call_llm_does_not_cache_errors():
+    """Cache Test: ответы с ошибкой не кешируются — следующий вызов снова идёт в сеть."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(500, {"error": "boom"})
+        assert app.call_llm('m', ['hi']).startswith('Ошибка HTTP 500')
+
+        request_mock.return_value = MockResponse(200, {"response": "ok"})
+        assert app.call_llm('m', ['hi']) == "ok"
+        assert request_mock.call_count == 2
+
+
+def test_circuit_breaker_short_circuits_after_consecutive_timeouts():
+    """Circuit Breaker Test: после серии таймаутов вызов возвращает ошибку мгновенно, без HTTP-запроса."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = read_timeout_error()
+        for _ in range(6):
+            app.call_llm('m', ['hi'])
+        assert request_mock.call_count == app.CIRCUIT_FAILURE_THRESHOLD
+
+        request_mock.reset_mock()
+        started = time.perf_counter()
+        res = app.call_llm('m', ['hi'])
+        elapsed = time.perf_counter() - started
+
+        assert 'circuit open' in res
+        assert elapsed < 0.01
+        request_mock.assert_not_called()
+
+
+def test_circuit_breaker_closes_after_successful_probe(monkeypatch):
+    """Circuit Breaker Test: после паузы пробный запрос проходит и успешный ответ закрывает цепь."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = read_timeout_error()
+        for _ in range(app.CIRCUIT_FAILURE_THRESHOLD):
+            app.call_llm('m', ['hi'])
+        assert 'circuit open' in app.call_llm('m', ['hi'])
+
+        # Пауза истекла — следующий вызов является пробным
+        monkeypatch.setattr(app, 'CIRCUIT_COOLDOWN', 0)
+        request_mock.side_effect = None
+        request_mock.return_value = MockResponse(200, {"response": "ok"})
+        assert app.call_llm('m', ['hi']) == "ok"
+        assert app._circuit_state['mentorpiece'] == {'fail_count': 0, 'opened_at': 0.0}
+
+
+def test_build_prompt_single_pass_validation():
+    """Prompt Builder Test: `_build_prompt` обрезает части, пропускает None и валидирует длину."""
+    app = import_app_module()
+
+    assert app._build_prompt(['  Переведи:  ', None, ' текст ']) == ("Переведи:\nтекст", None)
+    assert app._build_prompt('  один  ') == ("один", None)
+
+    prompt, error = app._build_prompt(['   ', None])
+    assert prompt is None and 'пустой' in error
+
+    # Граница длины учитывает разделители между частями
+    half = 'x' * (app.MAX_PROMPT_LEN // 2)
+    prompt, error = app._build_prompt([half, half])
+    assert prompt is None and 'слишком длин' in error
+    assert app._build_prompt([half, half[1:]])[1] is None
+
+
+def test_call_llm_invalid_json_response():
+    """Malformed API Response Test: API возвращает 200 с телом, которое не является JSON."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, content_data=b'<html>oops</html>')
+        res = app.call_llm('m', ['hi'])
+        assert res == "Ошибка: получен некорректный JSON от LLM"
+
+
+def test_routes_registered_once():
+    """Routing Test: модуль регистрирует ровно один GET и один POST обработчик для '/'."""
+    app = import_app_module()
+
+    rules = [r for r in app.app.url_map.iter_rules() if r.rule == '/']
+    endpoints = sorted(r.endpoint for r in rules)
+    assert endpoints == ['index_get', 'index_post']
+
+
+def test_openai_authorization_header_precomputed(monkeypatch):
+    """Environment Test: ключ OpenAI нормализуется при импорте и задаётся на сессии один раз."""
+    monkeypatch.setenv('OPENAI_API_KEY', '  Bearer sk-test  ')
+    app = import_app_module()
+    assert app._openai_session.headers['Authorization'] == 'Bearer sk-test'
+
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    app = import_app_module()
+    assert 'Authorization' not in app._openai_session.headers
+    assert 'OPENAI_API_KEY не задан' in app.call_openai('gpt', ['hi'])
+
+
+def test_call_llm_truncates_large_error_body():
+    """Error Handling: при 5xx с огромным телом в сообщение попадает только его начало."""
+    app = import_app_module()
+
+    huge_body = ('<html>' + 'Ошибка сервера ' * 100000 + '</html>').encode('utf-8')
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(502, content_data=huge_body)
+        res = app.call_llm('m', ['hi'])
+
+    assert res.startswith('Ошибка HTTP 502 от LLM: <html>Ошибка сервера')
+    assert len(res.encode('utf-8')) < app.ERROR_BODY_LIMIT + 100
+
+
+def test_index_post_rejects_blank_text_without_llm_calls():
+    """Form Test: текст из одних пробелов не отправляется в LLM, пользователь видит подсказку."""
+    app = import_app_module()
+    client = app.app.test_client()
+
+    with patch.object(app._http, 'request') as request_mock:
+        resp = client.post('/', data={'text': '   \n  ', 'language': 'German'})
+
+    assert resp.status_code == 200
+    assert 'Пожалуйста, введите текст для перевода.' in resp.get_data(as_text=True)
+    request_mock.assert_not_called()
+
+
+def test_call_llm_cache_ignores_trailing_whitespace():
+    """Cache Test: prompt, отличающийся только хвостовыми пробелами в строках, берётся из кеша."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, {"response": "Cached answer"})
+        app.call_llm('m', ['Переведи:', 'строка 1   \nстрока 2\t\n'])
+        # В сеть prompt уходит без изменений (кроме обрезки краёв каждого сообщения)
+        sent = json_module.loads(request_mock.call_args.kwargs['body'])
+        assert sent == {"model_name": "m", "prompt": "Переведи:\nстрока 1   \nстрока 2"}
+
+        res = app.call_llm('m', ['Переведи:', 'строка 1\nстрока 2'])
+        assert res == "Cached answer"
+        assert request_mock.call_count == 1
+
+        # Изменение внутри строки — это уже другой prompt
+        app.call_llm('m', ['Переведи:', 'строка 1\nстрока 3'])
+        assert request_mock.call_count == 2
+
+        # Разделители строк, отличные от "\n", не склеиваются с переносом строки
+        app.call_llm('m', ['Переведи:', 'строка 1\u2028строка 3'])
+        assert request_mock.call_count == 3
+
+
+def test_normalize_prompt_splits_on_newline_only():
+    """Cache Test: нормализация ключа режет только по "\n" и не трогает другие разделители."""
+    app = import_app_module()
+    assert app._normalize_prompt("a  \nb\t\n") == "a\nb"
+    assert app._normalize_prompt("a\rb\u2028c") == "a\rb\u2028c"
+
+
+def test_call_llm_cache_can_be_disabled(monkeypatch):
+    """Cache Test: при LLM_CACHE=0 каждый вызов идёт в сеть."""
+    monkeypatch.setenv('LLM_CACHE', '0')
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, {"response": "ok"})
+        app.call_llm('m', ['hi'])
+        app.call_llm('m', ['hi'])
+        assert request_mock.call_count == 2
+
+
+def test_template_auto_reload_disabled_by_default(monkeypatch):
+    """Config Test: без FLASK_DEBUG=1 Jinja не перепроверяет шаблоны на каждый рендер."""
+    monkeypatch.delenv('FLASK_DEBUG', raising=False)
+    app = import_app_module()
+    assert app.FLASK_DEBUG is False
+    assert app.app.jinja_env.auto_reload is False
+
+    monkeypatch.setenv('FLASK_DEBUG', '1')
+    app = import_app_module()
+    assert app.app.jinja_env.auto_reload is True
+
+
+def test_index_post_sends_prejoined_prompts():
+    """Form Test: перевод и оценка отправляются готовыми строками, результат попадает в страницу."""
+    app = import_app_module()
+    client = app.app.test_client()
+    sent = []
+
+    def fake_request(method, url, body=None, timeout=None, retries=None, preload_content=True):
+        payload = json_module.loads(body)
+        sent.append(payload)
+        if payload['model_name'] == "Qwen/Qwen3-VL-30B-A3B-Instruct":
+            return MockResponse(200, {"response": "The sun is shining."})
+        return MockResponse(200, {"response": "9/10"})
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = fake_request
+        resp = client.post('/', data={'text': 'Солнце светит.', 'language': 'English'})
+        page = resp.get_data(as_text=True)
+
+    assert 'The sun is shining.' in page and '9/10' in page
+    assert sent[0]['prompt'] == "Переведи следующий текст на English:\nСолнце светит."
+    assert sent[1]['prompt'] == (
+        "Оцени качество перевода от 1 до 10 и аргументируй.\n"
+        "Оригинал:\nСолнце светит.\nПеревод:\nThe sun is shining."
+    )
+
+
+def test_index_post_strips_padded_text_before_prompts():
+    """Form Test: CRLF и пробелы вокруг текста из textarea не попадают в prompt'ы."""
+    app = import_app_module()
+    client = app.app.test_client()
+    sent = []
+
+    def fake_request(method, url, body=None, timeout=None, retries=None, preload_content=True):
+        payload = json_module.loads(body)
+        sent.append(payload)
+        if payload['model_name'] == "Qwen/Qwen3-VL-30B-A3B-Instruct":
+            return MockResponse(200, {"response": "Hi"})
+        return MockResponse(200, {"response": "10/10"})
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = fake_request
+        resp = client.post('/', data={'text': '\r\n  Привет\r\n\r\n', 'language': 'English'})
+        resp.get_data()
+
+    assert sent[0]['prompt'] == "Переведи следующий текст на English:\nПривет"
+    assert sent[1]['prompt'] == "Оцени качество перевода от 1 до 10 и аргументируй.\nОригинал:\nПривет\nПеревод:\nHi"
+
+
+def test_call_llm_cache_rejects_hash_collisions():
+    """Cache Test: при совпадении 64-битного ключа у разных prompt ответ из кеша не подменяется."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock, \
+            patch.object(app.xxhash, 'xxh3_64_intdigest', return_value=42):
+        request_mock.return_value = MockResponse(200, {"response": "first"})
+        assert app.call_llm('m', 'prompt A') == "first"
+
+        request_mock.return_value = MockResponse(200, {"response": "second"})
+        assert app.call_llm('m', 'prompt B') == "second"
+        assert request_mock.call_count == 2
+
+
+def test_call_llm_adapts_read_timeout_to_latency():
+    """Timeout Test: после быстрых ответов таймаут чтения сокращается, но не ниже минимума."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, {"response": "ok"})
+        app.call_llm('m', 'первый запрос')
+        timeout = request_mock.call_args.kwargs['timeout']
+        assert (timeout.connect_timeout, timeout.read_timeout) == (3.05, 15)
+
+        for i in range(20):
+            app.call_llm('m', f'запрос {i}')
+        timeout = request_mock.call_args.kwargs['timeout']
+        assert timeout.connect_timeout == 3.05
+        assert timeout.read_timeout == app.ADAPTIVE_TIMEOUT_MIN
+
+        # Таймаут отражается в сообщении об ошибке
+        request_mock.side_effect = read_timeout_error()
+        res = app.call_llm('m', 'медленный запрос')
+        assert f'timeout={app.ADAPTIVE_TIMEOUT_MIN}s' in res
+
+
+def test_index_post_streams_translation_before_judge():
+    """Streaming Test: перевод отдаётся первой частью ответа до запроса к судье."""
+    app = import_app_module()
+    client = app.app.test_client()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = [
+            MockResponse(200, {"response": "The sun is shining."}),
+            MockResponse(200, {"response": "9/10"}),
+        ]
+        resp = client.post('/', data={'text': 'Солнце светит.', 'language': 'English'}, buffered=False)
+        chunks = iter(resp.response)
+
+        head = next(chunks).decode('utf-8')
+        assert 'The sun is shining.' in head
+        assert request_mock.call_count == 1
+
+        tail = b''.join(chunks).decode('utf-8')
+        assert '9/10' in tail
+        assert request_mock.call_count == 2
+
+
+def test_index_get_renders_full_page():
+    """Template Test: GET собирает страницу из обеих частей шаблона — три блока результатов."""
+    app = import_app_module()
+    page = app.app.test_client().get('/').get_data(as_text=True)
+    assert page.count('result-box"') == 3
+    assert page.count('</html>') == 1
+
+
+def test_index_post_skips_judge_when_translation_fails():
+    """Error Handling: если перевод вернул ошибку, запрос к судье не выполняется."""
+    app = import_app_module()
+    client = app.app.test_client()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.side_effect = read_timeout_error()
+        resp = client.post('/', data={'text': 'Солнце светит.', 'language': 'French'})
+        page = resp.get_data(as_text=True)
+
+    assert request_mock.call_count == 1
+    assert 'Ошибка: таймаут' in page
+    assert 'Перевод не выполнен — оценка пропущена.' in page
+
+
+def test_llm_retry_policy_bounds_repeated_paid_calls():
+    """Retry Test: 5xx повторяется не более одного раза и только в пределах окна от начала вызова."""
+    app = import_app_module()
+
+    assert app.LLM_RETRY.status == 1
+    assert app.LLM_RETRY.read is False
+
+    fresh = app.LLM_RETRY.new(deadline=time.monotonic() + 60)
+    assert fresh.is_retry('POST', 503)
+    # Дедлайн переносится на объект следующей попытки
+    assert fresh.new(total=1).deadline == fresh.deadline
+
+    late = app.LLM_RETRY.new(deadline=time.monotonic() - 1)
+    assert not late.is_retry('POST', 503)
+
+
+def test_call_llm_passes_retry_deadline():
+    """Retry Test: `call_llm` передаёт в urllib3 политику с дедлайном от начала вызова."""
+    app = import_app_module()
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, {"response": "ok"})
+        started = time.monotonic()
+        app.call_llm('m', 'hi')
+
+    retries = request_mock.call_args.kwargs['retries']
+    assert started <= retries.deadline <= time.monotonic() + app.LLM_RETRY_WINDOW
+
+
+def test_read_timeout_recovers_after_timeouts(monkeypatch):
+    """Timeout Test: после быстрых ответов серия таймаутов возвращает таймаут чтения к исходному."""
+    app = import_app_module()
+    # Проверяем только адаптацию таймаута — circuit breaker не должен вмешиваться
+    monkeypatch.setattr(app, 'CIRCUIT_FAILURE_THRESHOLD', 100)
+
+    with patch.object(app._http, 'request') as request_mock:
+        request_mock.return_value = MockResponse(200, {"response": "ok"})
+        for i in range(20):
+            app.call_llm('m', f'быстрый запрос {i}')
+        assert request_mock.call_args.kwargs['timeout'].read_timeout == app.ADAPTIVE_TIMEOUT_MIN
+
+        request_mock.side_effect = read_timeout_error()
+        used = []
+        for i in range(6):
+            app.call_llm('m', f'медленный запрос {i}')
+            used.append(request_mock.call_args.kwargs['timeout'].read_timeout)
+
+    assert used == sorted(used)
+    assert used[-1] == 15
+
+
+def test_llm_retry_policy_ignores_retry_after():
+    """Retry Test: Retry-After не продлевает вызов — 429/413 не повторяются, сна по заголовку нет."""
+    app = import_app_module()
+    retry = app.LLM_RETRY.new(deadline=time.monotonic() + 60)
+
+    assert not retry.is_retry('POST', 429, has_retry_after=True)
+    assert not retry.is_retry('POST', 413, has_retry_after=True)
+
+    response = urllib3.HTTPResponse(body=b'', status=503, headers={'Retry-After': '600'})
+    started = time.monotonic()
+    retry.sleep(response)
+    assert time.monotonic() - started < 1